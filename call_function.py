@@ -4,19 +4,30 @@ from functions.execute_file import execute_file
 from google.genai import types
 
 # Remove hardcoded working_directory - make it dynamic
-def call_function(function_call_part, working_directory, verbose=False):
-    if verbose:
-        print(f" - Calling function: {function_call_part.name}({function_call_part.args})")
-    else:
-        print(f" - Calling function: {function_call_part.name}")
+def call_function(function_call_part, working_directory, verbose=False, cache=None, quiet=False):
+    # quiet skips logging, e.g. so replay.py timings do not include stdout writes
+    if not quiet:
+        if verbose:
+            print(f" - Calling function: {function_call_part.name}({function_call_part.args})")
+        else:
+            print(f" - Calling function: {function_call_part.name}")
         
     result = ""
     if function_call_part.name == "get_file":
-        result = get_file(working_directory, **function_call_part.args)
+        if cache is not None:
+            result = cache.get_file(**function_call_part.args)
+        else:
+            result = get_file(working_directory, **function_call_part.args)
     if function_call_part.name == "read_file":
-        result = read_file(working_directory, **function_call_part.args)
+        if cache is not None:
+            result = cache.read_file(**function_call_part.args)
+        else:
+            result = read_file(working_directory, **function_call_part.args)
     if function_call_part.name == "execute_file":
         result = execute_file(working_directory, **function_call_part.args)
+        # The program may have written files (e.g. compiled binaries)
+        if cache is not None:
+            cache.invalidate()
     if result == "":   
         return types.Content(
             role="tool",
@@ -1 +1,6 @@
-MAX_CHARS = 10000
\ No newline at end of file
+MAX_CHARS = 10000
+
+# Server-side ceilings for per-request budgets; clients may only lower them
+MAX_ITERATIONS = 20
+MAX_REQUEST_TOKENS = 500000
+MAX_REQUEST_SECONDS = 300
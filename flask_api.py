@@ -1,13 +1,34 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import os
+import hmac
+import math
 import traceback  # Add this import
 from main import process_ai_request
+from config import MAX_ITERATIONS, MAX_REQUEST_TOKENS, MAX_REQUEST_SECONDS
 from git_manager import GitManager  # Add Git support
+from usage_tracker import UsageTracker
+from trace_recorder import ChatTrace
 
 
 app = Flask(__name__)
 CORS(app, origins=["https://copilot-frontend-xhtr.vercel.app"])
+usage_tracker = UsageTracker()
+# GET /api/usage is disabled unless USAGE_ADMIN_TOKEN is set
+USAGE_ADMIN_TOKEN = os.environ.get('USAGE_ADMIN_TOKEN')
+# Set TRACE_FILE to record every chat as a JSONL trace for replay.py
+TRACE_FILE = os.environ.get('TRACE_FILE')
+
+
+def record_trace(trace, result):
+    """Finish and append a chat trace; recording must never fail the request"""
+    if trace is None:
+        return
+    try:
+        trace.finish(result)
+        trace.write(TRACE_FILE)
+    except Exception as e:
+        print(f"Failed to write trace: {e}")
 
 
 @app.route('/api/health', methods=['GET'])
@@ -22,11 +43,36 @@ def chat():
         prompt = data.get('prompt')
         working_directory = data.get('working_directory', 'D:\\Hackathon\\calculator')
         verbose = data.get('verbose', False)
+        prefetch = data.get('prefetch', False)
+        # Allow-listed client name from X-Client-Key (never a caller-chosen id or IP)
+        client_name = usage_tracker.resolve_client(request.headers.get('X-Client-Key'))
+        
+        # Optional per-request budgets, capped at the server maximums
+        budgets = {
+            'max_iterations': MAX_ITERATIONS,
+            'max_tokens': MAX_REQUEST_TOKENS,
+            'max_seconds': MAX_REQUEST_SECONDS,
+        }
+        for key, server_max in list(budgets.items()):
+            value = data.get(key)
+            if value is None:
+                continue
+            if key == 'max_seconds':
+                valid = isinstance(value, (int, float)) and not isinstance(value, bool) \
+                    and math.isfinite(value) and value > 0
+            else:
+                valid = isinstance(value, int) and not isinstance(value, bool) and value >= 1
+            if not valid:
+                kind = "a positive number" if key == 'max_seconds' else "an integer >= 1"
+                return jsonify({"error": f"{key} must be {kind}"}), 400
+            budgets[key] = min(value, server_max)
         
         print(f"Received request:")  # Debug print
         print(f"  Prompt: {prompt}")
         print(f"  Working Directory: {working_directory}")
         print(f"  Verbose: {verbose}")
+        print(f"  Prefetch: {prefetch}")
+        print(f"  Budgets: {budgets}")
         
         if not prompt:
             return jsonify({"error": "Prompt is required"}), 400
@@ -43,7 +89,19 @@ def chat():
                 }), 400
         
         # Process the request
-        result = process_ai_request(prompt, working_directory, verbose)
+        trace = ChatTrace(prompt, working_directory) if TRACE_FILE else None
+        try:
+            result = process_ai_request(prompt, working_directory, verbose, prefetch, **budgets, trace=trace)
+        except Exception as e:
+            # Failed chats are part of real traffic too
+            record_trace(trace, {"error": f"Server error: {str(e)}"})
+            raise
+        record_trace(trace, result)
+        try:
+            usage_tracker.record(working_directory, client_name, result.get("tokenCounts"),
+                                 result.get("totalIterations"), result.get("stopReason"))
+        except Exception as e:
+            print(f"Failed to record usage: {e}")
         print(f"Result: {result}")  # Debug print
         
         if result.get("success"):
@@ -60,6 +118,22 @@ def chat():
         }), 500
 
 
+@app.route('/api/usage', methods=['GET'])
+def usage():
+    """Aggregated token usage per repository and per client, for capacity planning"""
+    provided_token = request.headers.get('X-Admin-Token', '')
+    if not USAGE_ADMIN_TOKEN or not hmac.compare_digest(provided_token.encode(), USAGE_ADMIN_TOKEN.encode()):
+        return jsonify({"error": "Forbidden"}), 403
+    
+    try:
+        return jsonify(usage_tracker.get_usage(
+            repo=request.args.get('repo'),
+            client=request.args.get('client')
+        )), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/api/validate-directory', methods=['POST'])
 def validate_directory():
     try:
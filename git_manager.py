@@ -1,16 +1,66 @@
 import os
 import shutil
 import tempfile
+import time
+import uuid
 from pathlib import Path
-from git import Repo
+from git import Repo, GitCommandError, InvalidGitRepositoryError, NoSuchPathError
 from urllib.parse import urlparse
 import hashlib
 
+from file_lock import file_lock
+
+
+# Worktree registrations not refreshed for this long are pruned from a store
+WORKTREE_MAX_AGE_HOURS = 24
+# How often clone_or_update_repo prunes a given store
+PRUNE_INTERVAL_SECONDS = 3600
+
+_warned_node_id = False
+
+
 class GitManager:
-    def __init__(self, base_cache_dir=None):
+    """
+    Multi-node deployments: point REPO_STORE_DIR at a shared volume and give every
+    node a stable NODE_ID (or a persistent REPO_CACHE_DIR, where a generated ID is
+    kept). Otherwise each restart registers a new node in the shared stores; those
+    registrations are only reclaimed once they age out (WORKTREE_MAX_AGE_HOURS).
+    """
+    
+    def __init__(self, base_cache_dir=None, store_dir=None):
         # Use temp directory if not specified
-        self.base_cache_dir = base_cache_dir or os.path.join(tempfile.gettempdir(), 'ai_coding_buddy_repos')
+        self.base_cache_dir = base_cache_dir or os.environ.get('REPO_CACHE_DIR') or \
+            os.path.join(tempfile.gettempdir(), 'ai_coding_buddy_repos')
+        # One bare object store per repository, shareable by every worker/node
+        self.store_dir = store_dir or os.environ.get('REPO_STORE_DIR') or os.path.join(self.base_cache_dir, 'store')
+        os.makedirs(self.store_dir, exist_ok=True)
         os.makedirs(self.base_cache_dir, exist_ok=True)
+        # Working copies are per node: worktree paths are registered in the shared store
+        self.worktree_dir = os.path.join(self.base_cache_dir, 'worktrees', self.get_node_id())
+        os.makedirs(self.worktree_dir, exist_ok=True)
+        # old->new sha of the last clone_or_update_repo call
+        self.last_update = None
+    
+    def get_node_id(self):
+        """Stable ID for this node: NODE_ID, else one generated once and kept next to the worktrees"""
+        global _warned_node_id
+        node_id = os.environ.get('NODE_ID')
+        if node_id:
+            return node_id
+        
+        if os.environ.get('REPO_STORE_DIR') and not os.environ.get('REPO_CACHE_DIR') and not _warned_node_id:
+            _warned_node_id = True
+            print("Warning: REPO_STORE_DIR is shared but neither NODE_ID nor REPO_CACHE_DIR is set; "
+                  "the generated node ID will not survive a restart")
+        
+        node_id_path = os.path.join(self.base_cache_dir, 'node_id')
+        try:
+            with open(node_id_path, 'x') as f:
+                f.write(uuid.uuid4().hex[:12])
+        except FileExistsError:
+            pass
+        with open(node_id_path, 'r') as f:
+            return f.read().strip()
     
     def get_repo_hash(self, git_url):
         """Generate a unique hash for the repository URL"""
@@ -25,38 +75,136 @@ class GitManager:
         except:
             return False
     
-    def clone_or_update_repo(self, git_url, branch='main'):
-        """Clone repository or update if it exists"""
+    def get_store_path(self, git_url):
+        return os.path.join(self.store_dir, f"{self.get_repo_hash(git_url)}.git")
+    
+    def get_worktree_path(self, git_url, branch=None):
+        """Default-branch checkouts live at <hash>; explicitly requested branches get their own"""
+        repo_hash = self.get_repo_hash(git_url)
+        if branch:
+            return os.path.join(self.worktree_dir, f"{repo_hash}-{hashlib.md5(branch.encode()).hexdigest()[:8]}")
+        return os.path.join(self.worktree_dir, repo_hash)
+    
+    def get_lock_path(self, git_url):
+        return os.path.join(self.store_dir, 'locks', f"{self.get_repo_hash(git_url)}.lock")
+    
+    def clone_or_update_repo(self, git_url, branch=None):
+        """Clone repository or update if it exists (defaults to the remote's default branch)"""
         if not self.is_valid_git_url(git_url):
             return None, "Invalid Git URL format"
         
-        repo_hash = self.get_repo_hash(git_url)
-        local_path = os.path.join(self.base_cache_dir, repo_hash)
+        store_path = self.get_store_path(git_url)
+        local_path = self.get_worktree_path(git_url, branch)
+        # Never leave a previous call's sha behind for a failed update
+        self.last_update = None
         
         try:
-            if os.path.exists(local_path):
-                # Repository exists, try to pull latest
-                print(f"Updating existing repository: {git_url}")
-                repo = Repo(local_path)
-                repo.remotes.origin.pull()
-            else:
-                # Clone new repository
-                print(f"Cloning repository: {git_url}")
-                repo = Repo.clone_from(git_url, local_path, branch=branch, depth=1)
-            
+            with file_lock(self.get_lock_path(git_url)):
+                branch = self._update_store(git_url, store_path, branch)
+                self.last_update = self._update_worktree(store_path, local_path, branch)
+                self._maybe_prune_store(store_path)
             return local_path, None
-            
         except Exception as e:
-            # If update fails, try fresh clone
-            if os.path.exists(local_path):
+            return None, f"Failed to clone repository: {str(e)}"
+    
+    def _update_store(self, git_url, store_path, branch):
+        """Clone or fetch the shared bare repository and return the branch used (caller holds the repo lock)"""
+        if os.path.exists(store_path):
+            try:
+                store = Repo(store_path)
+            except (InvalidGitRepositoryError, NoSuchPathError) as e:
+                # Corrupt store, fall back to a fresh clone
+                print(f"Store is not a repository ({e}), recloning: {git_url}")
+                shutil.rmtree(store_path)
+            else:
+                print(f"Updating existing repository: {git_url}")
+                return self._fetch_store(git_url, store, branch)
+        
+        print(f"Cloning repository: {git_url}")
+        # No --branch: the store's HEAD must record the remote's default branch,
+        # whichever branch this first caller asked for
+        store = Repo.clone_from(git_url, store_path, bare=True, depth=1)
+        # Keep worktrees registered by other hosts even if their paths are not visible here
+        store.git.config('gc.worktreePruneExpire', 'never')
+        default_branch = store.head.reference.name
+        if branch and branch != default_branch:
+            self._fetch_branch(store, branch)
+        return branch or default_branch
+    
+    def _fetch_store(self, git_url, store, branch):
+        """Fetch new objects into an existing store and return the branch used"""
+        # The default branch is resolved once at clone time and kept as the store's HEAD
+        requested_branch = branch
+        branch = branch or store.head.reference.name
+        try:
+            self._fetch_branch(store, branch)
+        except GitCommandError as e:
+            if "couldn't find remote ref" in str(e) and not requested_branch:
+                # Upstream renamed its default branch: resolve it again and move the store's HEAD
+                branch = self._resolve_default_branch(store)
+                print(f"Default branch of {git_url} is now {branch}")
+                self._fetch_branch(store, branch)
+                store.git.symbolic_ref('HEAD', f'refs/heads/{branch}')
+            elif f'refs/heads/{branch}' in [ref.path for ref in store.references]:
+                # Transient failure (network, remote down): serve what the store already has
+                print(f"Warning: fetch failed for {git_url}, serving cached checkout: {e}")
+            else:
+                raise
+        return branch
+    
+    def _fetch_branch(self, store, branch):
+        # Forced shallow refspec: only new objects are transferred and force-pushes just move the ref
+        store.git.fetch('origin', f'+refs/heads/{branch}:refs/heads/{branch}', depth=1)
+    
+    def _resolve_default_branch(self, store):
+        """Ask the remote which branch its HEAD points at"""
+        # e.g. "ref: refs/heads/main\tHEAD\n<sha>\tHEAD"
+        for line in store.git.ls_remote('--symref', 'origin', 'HEAD').splitlines():
+            if line.startswith('ref: refs/heads/'):
+                return line[len('ref: refs/heads/'):].split('\t')[0]
+        raise GitCommandError(['git', 'ls-remote', '--symref', 'origin', 'HEAD'], 128,
+                              stderr="could not resolve remote default branch")
+    
+    def _update_worktree(self, store_path, local_path, branch):
+        """Reset this host's worktree to the store's branch tip and return the old->new sha"""
+        store = Repo(store_path)
+        new_sha = store.commit(f'refs/heads/{branch}').hexsha
+        old_sha = None
+        
+        if os.path.exists(local_path):
+            try:
+                worktree = Repo(local_path)
+                old_sha = worktree.head.commit.hexsha
+                worktree.git.reset('--hard', new_sha)
+            except Exception:
+                # Worktree points at a store that was recloned
+                old_sha = None
                 shutil.rmtree(local_path)
-            
+        
+        if not os.path.exists(local_path):
+            # --force re-registers a path whose worktree was deleted from disk
+            store.git.worktree('add', '--force', '--detach', local_path, new_sha)
+        
+        # Mark the registration as live so prune_stale_worktrees keeps it
+        with open(os.path.join(local_path, '.git'), 'r') as f:
+            os.utime(f.read().strip()[len('gitdir: '):])
+        
+        # Lets downstream caches invalidate only what changed (None means "everything")
+        changed_files = None
+        if old_sha == new_sha:
+            changed_files = []
+        elif old_sha:
             try:
-                print(f"Fresh clone of repository: {git_url}")
-                repo = Repo.clone_from(git_url, local_path, branch=branch, depth=1)
-                return local_path, None
-            except Exception as fresh_error:
-                return None, f"Failed to clone repository: {str(fresh_error)}"
+                changed_files = store.git.diff('--name-only', old_sha, new_sha).splitlines()
+            except Exception:
+                pass
+        
+        return {
+            'branch': branch,
+            'old_sha': old_sha,
+            'new_sha': new_sha,
+            'changed_files': changed_files,
+        }
     
     def get_repo_info(self, local_path):
         """Get information about the cloned repository"""
@@ -72,13 +220,24 @@ class GitManager:
                 # Skip .git directory
                 if '.git' in root:
                     continue
+                # Worktrees have a .git file pointing at the shared store
+                files = [f for f in files if f != '.git']
                     
                 total_files += len(files)
                 code_files += sum(1 for f in files if Path(f).suffix.lower() in code_extensions)
             
+            # Worktrees are checked out detached; the branch comes from the update that
+            # produced this checkout (shared refs may already have moved past HEAD)
+            if not repo.head.is_detached:
+                branch = repo.active_branch.name
+            elif self.last_update:
+                branch = self.last_update['branch']
+            else:
+                branch = None
+            
             return {
                 'url': repo.remotes.origin.url,
-                'branch': repo.active_branch.name,
+                'branch': branch,
                 'last_commit': repo.head.commit.hexsha[:8],
                 'commit_message': repo.head.commit.message.strip(),
                 'total_files': total_files,
@@ -90,18 +249,84 @@ class GitManager:
         except Exception as e:
             return {'error': str(e)}
     
-    def cleanup_old_repos(self, max_age_hours=24):
-        """Clean up repositories older than max_age_hours"""
-        import time
+    def cleanup_old_repos(self, max_age_hours=WORKTREE_MAX_AGE_HOURS):
+        """Clean up this host's worktrees older than max_age_hours (shared stores are kept)"""
         current_time = time.time()
         
-        for repo_dir in os.listdir(self.base_cache_dir):
-            repo_path = os.path.join(self.base_cache_dir, repo_dir)
+        for repo_dir in os.listdir(self.worktree_dir):
+            repo_path = os.path.join(self.worktree_dir, repo_dir)
             if os.path.isdir(repo_path):
                 age_hours = (current_time - os.path.getctime(repo_path)) / 3600
                 if age_hours > max_age_hours:
                     try:
-                        shutil.rmtree(repo_path)
+                        # <hash> or <hash>-<branch hash> for explicitly requested branches
+                        repo_hash = repo_dir.split('-')[0]
+                        store_path = os.path.join(self.store_dir, f"{repo_hash}.git")
+                        with file_lock(os.path.join(self.store_dir, 'locks', f"{repo_hash}.lock")):
+                            if os.path.exists(store_path):
+                                Repo(store_path).git.worktree('remove', '--force', repo_path)
+                            else:
+                                shutil.rmtree(repo_path)
                         print(f"Cleaned up old repository: {repo_dir}")
                     except Exception as e:
                         print(f"Failed to cleanup {repo_dir}: {e}")
+        
+        self.prune_stale_worktrees(max_age_hours)
+    
+    def prune_stale_worktrees(self, max_age_hours=WORKTREE_MAX_AGE_HOURS):
+        """
+        Drop worktree registrations (from any node) not refreshed for max_age_hours.
+        
+        Git's own pruning is disabled in shared stores because it cannot see other
+        nodes' paths; without this, dead nodes' entries and the commits their HEADs
+        pin would accumulate forever. A live node whose entry was pruned simply
+        re-adds its worktree on the next update. clone_or_update_repo already runs
+        this per store every PRUNE_INTERVAL_SECONDS; this sweeps every store.
+        """
+        for store_name in os.listdir(self.store_dir):
+            store_path = os.path.join(self.store_dir, store_name)
+            if not store_name.endswith('.git') or not os.path.isdir(store_path):
+                continue
+            
+            lock_path = os.path.join(self.store_dir, 'locks', f"{store_name[:-len('.git')]}.lock")
+            with file_lock(lock_path):
+                self._prune_store(store_path, max_age_hours)
+    
+    def _maybe_prune_store(self, store_path):
+        """Prune a store at most every PRUNE_INTERVAL_SECONDS (caller holds the repo lock)"""
+        marker_path = os.path.join(store_path, 'last_prune')
+        try:
+            if time.time() - os.path.getmtime(marker_path) < PRUNE_INTERVAL_SECONDS:
+                return
+        except OSError:
+            pass
+        
+        try:
+            self._prune_store(store_path, WORKTREE_MAX_AGE_HOURS)
+            with open(marker_path, 'w'):
+                pass
+        except Exception as e:
+            print(f"Failed to prune {store_path}: {e}")
+    
+    def _prune_store(self, store_path, max_age_hours):
+        """Remove one store's stale worktree registrations (caller holds the repo lock)"""
+        admin_root = os.path.join(store_path, 'worktrees')
+        if not os.path.isdir(admin_root):
+            return
+        
+        current_time = time.time()
+        for admin_name in os.listdir(admin_root):
+            admin_path = os.path.join(admin_root, admin_name)
+            age_hours = (current_time - os.path.getmtime(admin_path)) / 3600
+            if age_hours <= max_age_hours:
+                continue
+            try:
+                # Remove the checkout too if it belongs to this node
+                with open(os.path.join(admin_path, 'gitdir'), 'r') as f:
+                    worktree_path = os.path.dirname(f.read().strip())
+                if os.path.isdir(worktree_path):
+                    shutil.rmtree(worktree_path)
+            except OSError:
+                pass
+            shutil.rmtree(admin_path, ignore_errors=True)
+            print(f"Pruned stale worktree registration: {os.path.basename(store_path)}/{admin_name}")
@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
@@ -11,12 +12,31 @@ from functions.execute_file import schema_execute_file
 from call_function import call_function
 # Git support
 from git_manager import GitManager
+# Speculative file prefetch
+from prefetch import PrefetchCache
+from config import MAX_ITERATIONS, MAX_REQUEST_TOKENS, MAX_REQUEST_SECONDS
+# Request recording for replay
+from trace_recorder import elapsed_ms
 
 
-def process_ai_request(prompt, working_directory, verbose_flag=False):
+BUDGET_ERRORS = {
+    "iterations": "Maximum iterations reached",
+    "tokens": "Token budget exceeded",
+    "time": "Time budget exceeded",
+}
+
+
+def process_ai_request(prompt, working_directory, verbose_flag=False, prefetch=False,
+                       max_iterations=MAX_ITERATIONS, max_tokens=MAX_REQUEST_TOKENS,
+                       max_seconds=MAX_REQUEST_SECONDS, trace=None):
     """
     Modified main function to accept working_directory and return results
+
+    max_iterations / max_tokens / max_seconds bound the request; when one runs
+    out the result is an error with the latest model text as partialResponse. An optional
+    ChatTrace records model turns and tool calls for replay.py.
     """
+    start_time = time.monotonic()
     # Git repository support
     git_manager = GitManager()
     original_directory = working_directory
@@ -29,6 +49,13 @@ def process_ai_request(prompt, working_directory, verbose_flag=False):
             return {"error": f"Git operation failed: {error}"}
         working_directory = local_path
         repo_info = git_manager.get_repo_info(local_path)
+        repo_info['last_update'] = git_manager.last_update
+    
+    if trace is not None:
+        trace.set_resolved_directory(working_directory)
+    
+    # Warm the cache while the first generate_content call is in flight
+    cache = PrefetchCache(working_directory).start() if prefetch else None
     
     load_dotenv()
     api_key = os.environ.get("GEMINI_API_KEY")
@@ -73,64 +100,113 @@ def process_ai_request(prompt, working_directory, verbose_flag=False):
         system_instruction=system_prompt
     )
     
-    max_iters = 20
     function_calls_made = []
+    # Cumulative over every turn, since each turn re-bills the whole history
+    token_counts = {'prompt_tokens': 0, 'response_tokens': 0, 'total_tokens': 0}
+    # Latest model text, returned as partialResponse if a budget runs out
+    partial_response = None
+    stop_reason = "iterations"
+    iterations = 0
     
-    for i in range(0, max_iters):
+    for _ in range(0, max_iterations):
+        iterations += 1
         
+        model_start = time.monotonic()
         response = client.models.generate_content(
         model="gemini-2.5-flash",
         contents=messages,
         config=config
         )
+        model_ms = elapsed_ms(model_start)
         
         if response is None or response.usage_metadata is None:
-            return {"error": "Response is malformed"}
+            return {
+                "error": "Response is malformed",
+                "tokenCounts": token_counts,
+                "totalIterations": iterations
+            }
         
         token_info = {
-            'prompt_tokens': response.usage_metadata.prompt_token_count,
-            'response_tokens': response.usage_metadata.candidates_token_count
+            'prompt_tokens': response.usage_metadata.prompt_token_count or 0,
+            'response_tokens': response.usage_metadata.candidates_token_count or 0
         }
+        token_counts['prompt_tokens'] += token_info['prompt_tokens']
+        token_counts['response_tokens'] += token_info['response_tokens']
+        # total_token_count also covers thinking tokens
+        token_counts['total_tokens'] += (response.usage_metadata.total_token_count
+                                         or token_info['prompt_tokens'] + token_info['response_tokens'])
+        if trace is not None:
+            trace.add_model_turn(model_ms, token_info)
         
         if verbose_flag:
             print(f"User prompt: {prompt}")
             print(f"Prompt token: {token_info['prompt_tokens']}")
             print(f"Response token: {token_info['response_tokens']}")
+            print(f"Total tokens so far: {token_counts['total_tokens']}")
         
         if response.candidates:
             for candidate in response.candidates:
                 if candidate is None or candidate.content is None:
                     continue
                 messages.append(candidate.content)
+                text = "".join(part.text for part in candidate.content.parts or [] if part.text)
+                if text.strip():
+                    partial_response = text
         
-        if response.function_calls:
-            for function_call_part in response.function_calls:
-                # Track function calls for frontend
-                function_calls_made.append({
-                    'name': function_call_part.name,
-                    'args': dict(function_call_part.args) if function_call_part.args else {}
-                })
-                
-                # Pass working_directory to call_function
-                result = call_function(function_call_part, working_directory, verbose_flag)
-                messages.append(result)
-        else:
+        if not response.function_calls:
             # final message - return comprehensive response
             return {
                 "success": True,
                 "finalResponse": response.text,
-                "tokenCounts": token_info if verbose_flag else None,
-                "totalIterations": i + 1,
+                "tokenCounts": token_counts,
+                "totalIterations": iterations,
                 "functionCalls": function_calls_made,
                 "workingDirectory": original_directory,
-                "repositoryInfo": repo_info
+                "repositoryInfo": repo_info,
+                "prefetchStats": cache.get_stats() if cache else None
             }
+        
+        # Stop before running more tools once a budget is spent
+        if max_tokens is not None and token_counts['total_tokens'] >= max_tokens:
+            stop_reason = "tokens"
+            break
+        if max_seconds is not None and time.monotonic() - start_time >= max_seconds:
+            stop_reason = "time"
+            break
+        
+        for function_call_part in response.function_calls:
+            # Track function calls for frontend
+            function_calls_made.append({
+                'name': function_call_part.name,
+                'args': dict(function_call_part.args) if function_call_part.args else {}
+            })
+            
+            # Pass working_directory to call_function
+            tool_start = time.monotonic()
+            result = call_function(function_call_part, working_directory, verbose_flag, cache)
+            if trace is not None:
+                trace.add_tool_call(function_call_part.name, function_calls_made[-1]['args'],
+                                    result, elapsed_ms(tool_start))
+            messages.append(result)
     
-    return {
-        "error": "Maximum iterations reached",
+    result = {
+        "stopReason": stop_reason,
+        "tokenCounts": token_counts,
+        "totalIterations": iterations,
         "functionCalls": function_calls_made,
-        "totalIterations": max_iters
+        "workingDirectory": original_directory,
+        "repositoryInfo": repo_info,
+        "prefetchStats": cache.get_stats() if cache else None
     }
+    # Not a final answer: the model was still calling tools, so the latest text
+    # is intermediate ("Let me look at the files") and only offered as partial
+    result.update({
+        "success": False,
+        "error": BUDGET_ERRORS[stop_reason],
+        "terminatedEarly": True,
+        "partialResponse": partial_response,
+    })
+    return result
 
 
 def main():
@@ -0,0 +1,193 @@
+import os
+import re
+import threading
+from pathlib import Path
+
+from config import MAX_CHARS
+from functions.get_file import get_file
+from functions.read_file import read_file
+
+# File names the model nearly always opens first, highest priority first
+PRIORITY_NAMES = {
+    'readme.md': 100, 'readme.rst': 100, 'readme.txt': 100, 'readme': 100,
+    'main.py': 80, 'app.py': 80, '__main__.py': 70, 'index.js': 80, 'index.ts': 80,
+    'server.js': 70, 'main.js': 70, 'main.cpp': 70, 'main.java': 70,
+    'package.json': 60, 'requirements.txt': 60, 'pyproject.toml': 60, 'setup.py': 50,
+    'cargo.toml': 60, 'pom.xml': 50, 'go.mod': 50, 'dockerfile': 30, 'makefile': 30,
+}
+SOURCE_EXTENSIONS = {'.py', '.js', '.jsx', '.ts', '.tsx', '.java', '.cpp', '.c', '.h', '.go', '.rs'}
+SKIP_DIRS = {'.git', 'node_modules', 'venv', '.venv', '__pycache__', 'dist', 'build'}
+
+# Module paths are tried before the bare `import X` form, so for
+# `import Button from './Button'` the path is counted, not the binding name
+IMPORT_PATTERN = re.compile(
+    r'^\s*(?:.*\bfrom\s+[\'"]([\w./@-]+)[\'"]'
+    r'|.*\brequire\(\s*[\'"]([\w./@-]+)[\'"]\s*\)'
+    r'|import\s+[\'"]([\w./@-]+)[\'"]'
+    r'|from\s+([\w.]+)\s+import'
+    r'|import\s+([\w.]+))',
+    re.MULTILINE,
+)
+
+
+class PrefetchCache:
+    """
+    Warms an in-memory copy of the tool results the model usually asks for first
+    (root listing plus the top-ranked files) and serves later calls from it.
+    """
+
+    def __init__(self, working_directory, max_files=8, max_scan_files=500):
+        self.working_directory = working_directory
+        self.max_files = max_files
+        self.max_scan_files = max_scan_files
+        # key -> (result, inserted_by_warm_up), so prefetch hits can be told apart from repeat reads
+        self._listings = {}
+        self._files = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        # Bumped by invalidate() so in-flight reads cannot re-insert stale content
+        self._generation = 0
+        self.prefetch_hits = 0
+        self.repeat_hits = 0
+        self.misses = 0
+
+    def start(self):
+        """Run the warm-up in a background thread so it overlaps the first model call"""
+        self._thread = threading.Thread(target=self.warm_up, daemon=True)
+        self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def warm_up(self):
+        with self._lock:
+            generation = self._generation
+        try:
+            listing = get_file(self.working_directory, ".")
+            if not self._insert(self._listings, ".", listing, generation, prefetched=True):
+                return
+
+            for file_path in self.rank_files()[:self.max_files]:
+                content = read_file(self.working_directory, file_path)
+                if not self._insert(self._files, file_path, content, generation, prefetched=True):
+                    return
+        except Exception as e:
+            print(f"Prefetch warm-up failed: {e}")
+
+    def _insert(self, store, key, value, generation, prefetched=False):
+        """Cache value unless invalidate() ran since it was read; returns False if stale"""
+        with self._lock:
+            if generation != self._generation:
+                return False
+            store.setdefault(key, (value, prefetched))
+            return True
+
+    def rank_files(self):
+        """Rank candidate files by name, size and how often other files import them"""
+        candidates = []
+        for root, dirs, files in os.walk(self.working_directory):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith('.')]
+            for name in files:
+                candidates.append(os.path.join(root, name))
+                if len(candidates) >= self.max_scan_files:
+                    break
+            if len(candidates) >= self.max_scan_files:
+                break
+
+        import_counts = self._count_imports(candidates)
+
+        scored = []
+        for abs_path in candidates:
+            rel_path = os.path.relpath(abs_path, self.working_directory)
+            name = os.path.basename(abs_path).lower()
+            try:
+                size = os.path.getsize(abs_path)
+            except OSError:
+                continue
+            if size == 0:
+                continue
+
+            score = PRIORITY_NAMES.get(name, 0)
+            if Path(name).suffix in SOURCE_EXTENSIONS:
+                score += 10
+            score += 5 * import_counts.get(Path(name).stem, 0)
+            # Shallow files are read first; huge files get truncated anyway
+            score -= 5 * rel_path.count(os.sep)
+            if size > MAX_CHARS:
+                score -= 20
+
+            if score > 0:
+                scored.append((score, rel_path))
+
+        scored.sort(key=lambda item: (-item[0], item[1]))
+        return [rel_path for _, rel_path in scored]
+
+    def _count_imports(self, candidates):
+        counts = {}
+        for abs_path in candidates:
+            if Path(abs_path).suffix.lower() not in SOURCE_EXTENSIONS:
+                continue
+            try:
+                with open(abs_path, "r", errors="ignore") as f:
+                    source = f.read(MAX_CHARS)
+            except OSError:
+                continue
+            for match in IMPORT_PATTERN.finditer(source):
+                js_path = match.group(1) or match.group(2) or match.group(3)
+                if js_path:
+                    # './components/Button.jsx' -> 'button'
+                    stem = os.path.splitext(js_path.rstrip('/').split('/')[-1])[0]
+                else:
+                    # 'pkg.module' -> 'module'
+                    stem = (match.group(4) or match.group(5)).split('.')[-1]
+                # Lowercased like the file names it is matched against
+                stem = stem.lower()
+                if stem:
+                    counts[stem] = counts.get(stem, 0) + 1
+        return counts
+
+    def get_file(self, directory="."):
+        return self._lookup(self._listings, os.path.normpath(directory),
+                            lambda: get_file(self.working_directory, directory))
+
+    def read_file(self, file_path):
+        return self._lookup(self._files, os.path.normpath(file_path),
+                            lambda: read_file(self.working_directory, file_path))
+
+    def _lookup(self, store, key, load):
+        with self._lock:
+            if key in store:
+                value, prefetched = store[key]
+                if prefetched:
+                    self.prefetch_hits += 1
+                else:
+                    self.repeat_hits += 1
+                return value
+            self.misses += 1
+            generation = self._generation
+        value = load()
+        self._insert(store, key, value, generation)
+        return value
+
+    def invalidate(self):
+        """Drop cached results, e.g. after a tool may have written to the tree"""
+        with self._lock:
+            self._generation += 1
+            self._listings.clear()
+            self._files.clear()
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.prefetch_hits + self.repeat_hits + self.misses
+            return {
+                'prefetch_hits': self.prefetch_hits,
+                'repeat_hits': self.repeat_hits,
+                'misses': self.misses,
+                # Share of tool calls answered by the warm-up itself
+                'prefetch_hit_rate': round(self.prefetch_hits / lookups, 3) if lookups else 0.0,
+                'cache_hit_rate': round((self.prefetch_hits + self.repeat_hits) / lookups, 3) if lookups else 0.0,
+                'cached_listings': len(self._listings),
+                'cached_files': len(self._files),
+            }
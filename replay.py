@@ -0,0 +1,149 @@
+"""
+Replay recorded chat traces (written when TRACE_FILE is set) for load regression testing.
+
+The model is stubbed: each turn sleeps for its recorded latency (scaled by
+--model-latency-scale, 0 disables it). The tool side runs for real through
+call_function, so throughput and latency can be compared between versions of
+call_function, execute_file and GitManager on production traffic shapes.
+
+    python replay.py traces.jsonl --repo D:\\Hackathon\\calculator --concurrency 8
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.genai import types
+
+from call_function import call_function
+from git_manager import GitManager
+from prefetch import PrefetchCache
+from trace_recorder import elapsed_ms, summarize_result
+
+
+def load_traces(trace_file):
+    with open(trace_file, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def resolve_directory(record, repo):
+    """Use --repo if given, otherwise the recorded directory (cloning Git URLs through GitManager)"""
+    if repo:
+        return repo
+    git_manager = GitManager()
+    if git_manager.is_valid_git_url(record['working_directory']):
+        local_path, error = git_manager.clone_or_update_repo(record['working_directory'])
+        if error:
+            raise RuntimeError(error)
+        return local_path
+    return record['working_directory']
+
+
+def replay_trace(record, repo=None, model_latency_scale=1.0, prefetch=False):
+    """Re-execute one chat's tool calls turn by turn and time them"""
+    start = time.monotonic()
+    working_directory = resolve_directory(record, repo)
+    setup_ms = elapsed_ms(start)
+    cache = PrefetchCache(working_directory).start() if prefetch else None
+
+    tool_timings = []
+    mismatches = 0
+    errors = 0
+    for turn in record['turns']:
+        if model_latency_scale:
+            time.sleep(turn['model_ms'] * model_latency_scale / 1000)
+        for tool_call in turn['tool_calls']:
+            function_call_part = types.FunctionCall(name=tool_call['name'], args=tool_call['args'])
+            tool_start = time.monotonic()
+            try:
+                result = call_function(function_call_part, working_directory, cache=cache, quiet=True)
+            except Exception:
+                errors += 1
+                continue
+            tool_timings.append((tool_call['name'], elapsed_ms(tool_start), tool_call['tool_ms']))
+            # Only meaningful when replaying against the same tree that was recorded
+            if summarize_result(result)['sha1'] != tool_call['result']['sha1']:
+                mismatches += 1
+
+    return {
+        'latency_ms': elapsed_ms(start),
+        'setup_ms': setup_ms,
+        'tool_timings': tool_timings,
+        'mismatches': mismatches,
+        'errors': errors,
+        'prefetch': cache.get_stats() if cache else None,
+    }
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def summarize(results, wall_seconds):
+    latencies = [r['latency_ms'] for r in results]
+    summary = {
+        'chats': len(results),
+        'wall_seconds': round(wall_seconds, 3),
+        'throughput_chats_per_s': round(len(results) / wall_seconds, 3) if wall_seconds else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'max': max(latencies, default=None),
+        },
+        'setup_ms_p50': percentile([r['setup_ms'] for r in results], 50),
+        'result_mismatches': sum(r['mismatches'] for r in results),
+        'tool_errors': sum(r['errors'] for r in results),
+        'tools': {},
+    }
+
+    by_tool = {}
+    for r in results:
+        for name, replay_ms, recorded_ms in r['tool_timings']:
+            by_tool.setdefault(name, ([], []))
+            by_tool[name][0].append(replay_ms)
+            by_tool[name][1].append(recorded_ms)
+    for name, (replay_ms, recorded_ms) in by_tool.items():
+        summary['tools'][name] = {
+            'calls': len(replay_ms),
+            'replay_p50_ms': percentile(replay_ms, 50),
+            'replay_p95_ms': percentile(replay_ms, 95),
+            'recorded_p50_ms': percentile(recorded_ms, 50),
+            'recorded_p95_ms': percentile(recorded_ms, 95),
+        }
+
+    hit_rates = [r['prefetch']['prefetch_hit_rate'] for r in results if r['prefetch']]
+    if hit_rates:
+        summary['prefetch_hit_rate_avg'] = round(sum(hit_rates) / len(hit_rates), 3)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded chat traces against a local repository")
+    parser.add_argument('trace_file', help="JSONL file written via TRACE_FILE")
+    parser.add_argument('--repo', help="Local directory to run every trace against (default: recorded directory)")
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1, help="Replay the trace set this many times")
+    parser.add_argument('--model-latency-scale', type=float, default=1.0,
+                        help="Multiplier for recorded model latency (0 = no model delay)")
+    parser.add_argument('--prefetch', action='store_true', help="Serve tool calls through PrefetchCache")
+    args = parser.parse_args()
+
+    traces = load_traces(args.trace_file) * args.repeat
+    print(f"Replaying {len(traces)} chats with concurrency {args.concurrency}")
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(
+            lambda record: replay_trace(record, args.repo, args.model_latency_scale, args.prefetch),
+            traces,
+        ))
+    wall_seconds = time.monotonic() - start
+
+    print(json.dumps(summarize(results, wall_seconds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Budget checks for process_ai_request (with a scripted model) and /api/chat validation.
+
+Runs under pytest or directly: python test_budgets.py
+"""
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+
+from google.genai import types
+
+import flask_api
+import main
+
+
+def model_turn(text=None, calls=(), prompt_tokens=100, response_tokens=10):
+    """A generate_content response: optional text plus function calls"""
+    parts = [types.Part(text=text)] if text else []
+    function_calls = [types.FunctionCall(name=name, args=args) for name, args in calls]
+    parts += [types.Part(function_call=call) for call in function_calls]
+    return SimpleNamespace(
+        usage_metadata=SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=response_tokens,
+            total_token_count=prompt_tokens + response_tokens,
+        ),
+        candidates=[SimpleNamespace(content=types.Content(role="model", parts=parts))],
+        function_calls=function_calls or None,
+        text=text,
+    )
+
+
+def run_with_model(turns, **budgets):
+    """Run process_ai_request against a temp directory with a scripted model"""
+    root = tempfile.mkdtemp()
+    script = iter(turns)
+    fake_client = SimpleNamespace(models=SimpleNamespace(generate_content=lambda **kwargs: next(script)))
+    original_client = main.genai.Client
+    main.genai.Client = lambda **kwargs: fake_client
+    try:
+        with open(os.path.join(root, 'main.py'), 'w') as f:
+            f.write("print('hi')\n")
+        return main.process_ai_request("what is here?", root, **budgets)
+    finally:
+        main.genai.Client = original_client
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def looping_turns(count):
+    return [model_turn(f"Let me look ({i})", [('get_file', {'directory': '.'})]) for i in range(count)]
+
+
+def test_final_answer_is_success():
+    result = run_with_model([
+        model_turn("Listing files", [('get_file', {'directory': '.'})]),
+        model_turn("It prints hi."),
+    ])
+
+    assert result['success'] is True
+    assert result['finalResponse'] == "It prints hi."
+    assert result['totalIterations'] == 2
+    assert result['tokenCounts'] == {'prompt_tokens': 200, 'response_tokens': 20, 'total_tokens': 220}
+
+
+def test_iteration_budget_is_an_error_with_partial_response():
+    result = run_with_model(looping_turns(5), max_iterations=3)
+
+    assert result['success'] is False
+    assert result['error'] == "Maximum iterations reached"
+    assert result['stopReason'] == "iterations"
+    assert result['terminatedEarly'] is True
+    assert result['partialResponse'] == "Let me look (2)"
+    assert 'finalResponse' not in result
+    assert result['totalIterations'] == 3
+
+
+def test_token_budget_stops_before_running_more_tools():
+    # 110 tokens per turn: the third turn crosses 300
+    result = run_with_model(looping_turns(5), max_tokens=300)
+
+    assert result['success'] is False
+    assert result['stopReason'] == "tokens"
+    assert result['totalIterations'] == 3
+    assert len(result['functionCalls']) == 2
+    assert result['tokenCounts']['total_tokens'] == 330
+
+
+def test_time_budget():
+    result = run_with_model(looping_turns(5), max_seconds=1e-9)
+
+    assert result['stopReason'] == "time"
+    assert result['totalIterations'] == 1
+    assert result['functionCalls'] == []
+
+
+def test_budget_without_any_text():
+    turns = [model_turn(None, [('get_file', {'directory': '.'})]) for _ in range(2)]
+    result = run_with_model(turns, max_iterations=2)
+
+    assert result['success'] is False
+    assert result['partialResponse'] is None
+
+
+def test_zero_iterations_does_not_crash():
+    result = run_with_model([], max_iterations=0)
+
+    assert result['totalIterations'] == 0
+    assert result['stopReason'] == "iterations"
+
+
+def post_chat(body):
+    """POST /api/chat, capturing the budgets passed to process_ai_request"""
+    captured = {}
+
+    def fake_process_ai_request(prompt, working_directory, verbose, prefetch, **kwargs):
+        captured.update(kwargs)
+        return {"success": True, "finalResponse": "ok", "totalIterations": 1}
+
+    original = flask_api.process_ai_request
+    flask_api.process_ai_request = fake_process_ai_request
+    try:
+        response = flask_api.app.test_client().post(
+            '/api/chat',
+            data=body,
+            content_type='application/json',
+        )
+    finally:
+        flask_api.process_ai_request = original
+    return response, captured
+
+
+def test_chat_rejects_invalid_budgets():
+    here = os.path.dirname(os.path.abspath(__file__)).replace('\\', '\\\\')
+    for budget in ['"max_iterations": 0.5', '"max_iterations": 0', '"max_iterations": true',
+                   '"max_iterations": "5"', '"max_tokens": 1.5', '"max_seconds": Infinity',
+                   '"max_seconds": -1', '"max_seconds": NaN']:
+        body = f'{{"prompt": "hi", "working_directory": "{here}", {budget}}}'
+        response, captured = post_chat(body)
+        assert response.status_code == 400, budget
+        assert captured == {}, budget
+
+
+def test_chat_caps_budgets_at_server_maximums():
+    here = os.path.dirname(os.path.abspath(__file__)).replace('\\', '\\\\')
+    body = (f'{{"prompt": "hi", "working_directory": "{here}", '
+            f'"max_iterations": 100000, "max_tokens": 10000000000, "max_seconds": 1e9}}')
+
+    response, captured = post_chat(body)
+
+    assert response.status_code == 200
+    assert captured['max_iterations'] == main.MAX_ITERATIONS
+    assert captured['max_tokens'] == main.MAX_REQUEST_TOKENS
+    assert captured['max_seconds'] == main.MAX_REQUEST_SECONDS
+
+
+def test_chat_passes_lower_budgets_through():
+    here = os.path.dirname(os.path.abspath(__file__)).replace('\\', '\\\\')
+    body = f'{{"prompt": "hi", "working_directory": "{here}", "max_iterations": 3, "max_seconds": 2.5}}'
+
+    response, captured = post_chat(body)
+
+    assert response.status_code == 200
+    assert captured['max_iterations'] == 3
+    assert captured['max_seconds'] == 2.5
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,265 @@
+"""
+Clone / update / force-push checks for GitManager against a local file:// upstream.
+
+Runs under pytest or directly: python test_git_manager.py
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from git_manager import GitManager
+
+
+class LocalGitManager(GitManager):
+    """GitManager that accepts file:// URLs so tests need no network"""
+
+    def is_valid_git_url(self, url):
+        return url.startswith('file://')
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ['git', '-c', 'user.email=test@example.com', '-c', 'user.name=test', *args],
+        cwd=cwd, check=True, capture_output=True, text=True,
+    ).stdout.strip()
+
+
+def commit(upstream, name, content=None):
+    with open(os.path.join(upstream, name), 'w') as f:
+        f.write(content or name)
+    git(upstream, 'add', name)
+    git(upstream, 'commit', '-qm', name)
+    return git(upstream, 'rev-parse', 'HEAD')
+
+
+def make_upstream(root, branch='master'):
+    upstream = os.path.join(root, 'upstream')
+    os.makedirs(upstream)
+    git(upstream, 'init', '-q', '-b', branch)
+    commit(upstream, 'README.md')
+    return upstream
+
+
+def registration_path(manager, url):
+    """The store-side worktrees/<name> directory for manager's checkout of url"""
+    with open(os.path.join(manager.worktree_dir, manager.get_repo_hash(url), '.git'), 'r') as f:
+        return f.read().strip()[len('gitdir: '):]
+
+
+def with_tmp(test):
+    def run():
+        root = tempfile.mkdtemp()
+        try:
+            test(root)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    run.__name__ = test.__name__
+    return run
+
+
+@with_tmp
+def test_clone_follows_default_branch(root):
+    upstream = make_upstream(root, branch='master')
+    manager = LocalGitManager(os.path.join(root, 'cache'))
+
+    local_path, error = manager.clone_or_update_repo(f'file://{upstream}')
+
+    assert error is None
+    assert os.path.isfile(os.path.join(local_path, 'README.md'))
+    assert manager.last_update['branch'] == 'master'
+    assert manager.last_update['old_sha'] is None
+    assert manager.get_repo_info(local_path)['branch'] == 'master'
+
+
+@with_tmp
+def test_update_records_changed_files(root):
+    upstream = make_upstream(root)
+    url = f'file://{upstream}'
+    manager = LocalGitManager(os.path.join(root, 'cache'))
+    manager.clone_or_update_repo(url)
+    old_sha = manager.last_update['new_sha']
+
+    new_sha = commit(upstream, 'main.py')
+    local_path, error = manager.clone_or_update_repo(url)
+
+    assert error is None
+    assert manager.last_update['old_sha'] == old_sha
+    assert manager.last_update['new_sha'] == new_sha
+    assert manager.last_update['changed_files'] == ['main.py']
+    assert os.path.isfile(os.path.join(local_path, 'main.py'))
+
+
+@with_tmp
+def test_force_push_resets_worktree(root):
+    upstream = make_upstream(root)
+    url = f'file://{upstream}'
+    manager = LocalGitManager(os.path.join(root, 'cache'))
+    commit(upstream, 'dropped.py')
+    manager.clone_or_update_repo(url)
+
+    git(upstream, 'reset', '-q', '--hard', 'HEAD~1')
+    new_sha = commit(upstream, 'rewritten.py')
+    local_path, error = manager.clone_or_update_repo(url)
+
+    assert error is None
+    assert manager.last_update['new_sha'] == new_sha
+    assert not os.path.exists(os.path.join(local_path, 'dropped.py'))
+    assert os.path.isfile(os.path.join(local_path, 'rewritten.py'))
+
+
+@with_tmp
+def test_concurrent_workers_share_one_store(root):
+    upstream = make_upstream(root)
+    url = f'file://{upstream}'
+    cache = os.path.join(root, 'cache')
+
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: LocalGitManager(cache).clone_or_update_repo(url), range(4)))
+
+    assert all(error is None for _, error in results)
+    assert len({local_path for local_path, _ in results}) == 1
+    manager = LocalGitManager(cache)
+    assert set(os.listdir(manager.store_dir)) == {'locks', f'{manager.get_repo_hash(url)}.git'}
+
+
+@with_tmp
+def test_prune_stale_worktree_registrations(root):
+    upstream = make_upstream(root)
+    url = f'file://{upstream}'
+    store_dir = os.path.join(root, 'store')
+    alive = LocalGitManager(os.path.join(root, 'node_a'), store_dir=store_dir)
+    dead = LocalGitManager(os.path.join(root, 'node_b'), store_dir=store_dir)
+    alive.clone_or_update_repo(url)
+    dead.clone_or_update_repo(url)
+
+    admin_root = os.path.join(alive.get_store_path(url), 'worktrees')
+    assert len(os.listdir(admin_root)) == 2
+    # node_b has not refreshed its worktree for two days
+    stale = time.time() - 48 * 3600
+    os.utime(registration_path(dead, url), (stale, stale))
+
+    alive.prune_stale_worktrees(max_age_hours=24)
+
+    assert os.listdir(admin_root) == [os.path.basename(registration_path(alive, url))]
+    # A pruned node recovers on its next update
+    local_path, error = dead.clone_or_update_repo(url)
+    assert error is None
+    assert os.path.isfile(os.path.join(local_path, 'README.md'))
+
+
+@with_tmp
+def test_updates_prune_stale_registrations_periodically(root):
+    upstream = make_upstream(root)
+    url = f'file://{upstream}'
+    store_dir = os.path.join(root, 'store')
+    alive = LocalGitManager(os.path.join(root, 'node_a'), store_dir=store_dir)
+    dead = LocalGitManager(os.path.join(root, 'node_b'), store_dir=store_dir)
+    alive.clone_or_update_repo(url)
+    dead.clone_or_update_repo(url)
+    admin_root = os.path.join(alive.get_store_path(url), 'worktrees')
+    stale = time.time() - 48 * 3600
+    os.utime(registration_path(dead, url), (stale, stale))
+
+    # Pruned recently: the update leaves the stale entry alone
+    alive.clone_or_update_repo(url)
+    assert len(os.listdir(admin_root)) == 2
+
+    marker_path = os.path.join(alive.get_store_path(url), 'last_prune')
+    os.utime(marker_path, (stale, stale))
+    alive.clone_or_update_repo(url)
+    assert os.listdir(admin_root) == [os.path.basename(registration_path(alive, url))]
+
+
+@with_tmp
+def test_repo_info_branch_survives_other_nodes_fetching(root):
+    upstream = make_upstream(root)
+    url = f'file://{upstream}'
+    store_dir = os.path.join(root, 'store')
+    node_a = LocalGitManager(os.path.join(root, 'node_a'), store_dir=store_dir)
+    node_b = LocalGitManager(os.path.join(root, 'node_b'), store_dir=store_dir)
+    local_path, _ = node_a.clone_or_update_repo(url)
+
+    commit(upstream, 'newer.py')
+    node_b.clone_or_update_repo(url)
+
+    assert node_a.get_repo_info(local_path)['branch'] == 'master'
+
+
+@with_tmp
+def test_renamed_default_branch_is_resolved_again(root):
+    upstream = make_upstream(root, branch='master')
+    url = f'file://{upstream}'
+    manager = LocalGitManager(os.path.join(root, 'cache'))
+    manager.clone_or_update_repo(url)
+
+    git(upstream, 'branch', '-m', 'master', 'main')
+    new_sha = commit(upstream, 'after_rename.py')
+    local_path, error = manager.clone_or_update_repo(url)
+
+    assert error is None
+    assert manager.last_update['branch'] == 'main'
+    assert manager.last_update['new_sha'] == new_sha
+    assert os.path.isfile(os.path.join(local_path, 'after_rename.py'))
+    # The store remembers the new default for later updates
+    manager.clone_or_update_repo(url)
+    assert manager.last_update['branch'] == 'main'
+
+
+@with_tmp
+def test_explicit_branch_does_not_replace_default(root):
+    upstream = make_upstream(root, branch='master')
+    url = f'file://{upstream}'
+    git(upstream, 'checkout', '-q', '-b', 'dev')
+    commit(upstream, 'dev_only.py')
+    git(upstream, 'checkout', '-q', 'master')
+    manager = LocalGitManager(os.path.join(root, 'cache'))
+
+    dev_path, error = manager.clone_or_update_repo(url, branch='dev')
+    assert error is None
+    assert manager.last_update['branch'] == 'dev'
+    assert os.path.isfile(os.path.join(dev_path, 'dev_only.py'))
+
+    default_path, error = manager.clone_or_update_repo(url)
+    assert error is None
+    assert manager.last_update['branch'] == 'master'
+    assert default_path != dev_path
+    assert not os.path.exists(os.path.join(default_path, 'dev_only.py'))
+    # The branch checkout is untouched by the default-branch request
+    assert os.path.isfile(os.path.join(dev_path, 'dev_only.py'))
+
+
+@with_tmp
+def test_unreachable_upstream_serves_cached_checkout(root):
+    upstream = make_upstream(root)
+    url = f'file://{upstream}'
+    manager = LocalGitManager(os.path.join(root, 'cache'))
+    first_path, _ = manager.clone_or_update_repo(url)
+
+    shutil.move(upstream, upstream + '.offline')
+    local_path, error = manager.clone_or_update_repo(url)
+
+    assert error is None
+    assert local_path == first_path
+    assert os.path.isfile(os.path.join(local_path, 'README.md'))
+
+
+@with_tmp
+def test_failed_update_clears_last_update(root):
+    upstream = make_upstream(root)
+    manager = LocalGitManager(os.path.join(root, 'cache'))
+    manager.clone_or_update_repo(f'file://{upstream}')
+
+    local_path, error = manager.clone_or_update_repo(f'file://{upstream}', branch='missing')
+
+    assert local_path is None and error
+    assert manager.last_update is None
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,128 @@
+"""
+Ranking and cache-accounting checks for PrefetchCache on a fixture tree.
+
+Runs under pytest or directly: python test_prefetch.py
+"""
+import os
+import shutil
+import tempfile
+import threading
+
+import prefetch
+from prefetch import PrefetchCache
+
+
+FIXTURE = {
+    'README.md': '# Demo\n',
+    'package.json': '{"name": "demo"}\n',
+    'src/App.jsx': (
+        "import React from 'react'\n"
+        "import Button from './components/Button'\n"
+        "import './styles.css'\n"
+        "const api = require('./lib/api.js')\n"
+    ),
+    'src/components/Button.jsx': 'export default function Button() {}\n',
+    'src/components/Unused.jsx': 'export default function Unused() {}\n',
+    'src/lib/api.js': 'module.exports = {}\n',
+    'tools/run.py': 'from tools.helpers import main\nimport os\n',
+    'tools/helpers.py': 'def main(): pass\n',
+}
+
+
+def with_fixture(test):
+    def run():
+        root = tempfile.mkdtemp()
+        try:
+            for rel_path, content in FIXTURE.items():
+                path = os.path.join(root, *rel_path.split('/'))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w') as f:
+                    f.write(content)
+            test(root)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    run.__name__ = test.__name__
+    return run
+
+
+@with_fixture
+def test_count_imports_uses_module_paths(root):
+    cache = PrefetchCache(root)
+    candidates = [os.path.join(root, *rel_path.split('/')) for rel_path in FIXTURE]
+
+    counts = cache._count_imports(candidates)
+
+    assert counts['button'] == 1
+    assert counts['api'] == 1
+    assert counts['helpers'] == 1
+    # Binding names are not module references
+    assert 'Button' not in counts and 'React' not in counts
+
+
+@with_fixture
+def test_rank_files_prefers_entry_points_and_imported_files(root):
+    ranked = PrefetchCache(root).rank_files()
+
+    assert ranked[0] == 'README.md'
+    button = os.path.join('src', 'components', 'Button.jsx')
+    unused = os.path.join('src', 'components', 'Unused.jsx')
+    assert button in ranked
+    assert unused not in ranked or ranked.index(button) < ranked.index(unused)
+
+
+@with_fixture
+def test_prefetch_and_repeat_hits_counted_separately(root):
+    cache = PrefetchCache(root, max_files=1).start()
+    cache.wait()
+
+    cache.get_file('.')              # prefetched listing
+    cache.read_file('./README.md')   # prefetched file
+    cache.read_file('package.json')  # miss
+    cache.read_file('package.json')  # repeat hit on the miss
+
+    stats = cache.get_stats()
+    assert stats['prefetch_hits'] == 2
+    assert stats['repeat_hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['prefetch_hit_rate'] == 0.5
+    assert stats['cache_hit_rate'] == 0.75
+
+
+@with_fixture
+def test_invalidate_during_warm_up_drops_stale_reads(root):
+    entered = threading.Event()
+    release = threading.Event()
+    original_read_file = prefetch.read_file
+
+    def blocking_read_file(working_directory, file_path):
+        content = original_read_file(working_directory, file_path)
+        entered.set()
+        release.wait(5)
+        return content
+
+    prefetch.read_file = blocking_read_file
+    try:
+        cache = PrefetchCache(root).start()
+        assert entered.wait(5)
+        # The file changes (e.g. via execute_file) while warm-up holds the old content
+        with open(os.path.join(root, 'README.md'), 'w') as f:
+            f.write('# Changed\n')
+        cache.invalidate()
+        release.set()
+        cache.wait(5)
+    finally:
+        prefetch.read_file = original_read_file
+
+    stats = cache.get_stats()
+    assert stats['cached_listings'] == 0 and stats['cached_files'] == 0
+
+    assert cache.read_file('README.md') == '# Changed\n'
+    stats = cache.get_stats()
+    assert (stats['prefetch_hits'], stats['repeat_hits'], stats['misses']) == (0, 0, 1)
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"{name}: ok")
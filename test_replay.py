@@ -0,0 +1,134 @@
+"""
+Round trip for trace recording and replay: record a chat with ChatTrace,
+then replay it through replay.py against a temp directory with no model delay.
+
+Runs under pytest or directly: python test_replay.py
+"""
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from google.genai import types
+
+import replay
+from call_function import call_function
+from trace_recorder import ChatTrace
+
+
+def with_tmp(test):
+    def run():
+        root = tempfile.mkdtemp()
+        try:
+            # Traces live outside the replayed tree so they do not change its listing
+            repo = os.path.join(root, 'repo')
+            os.makedirs(repo)
+            with open(os.path.join(repo, 'main.py'), 'w') as f:
+                f.write("print('hi')\n")
+            test(repo, os.path.join(root, 'traces', 'chat.jsonl'))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    run.__name__ = test.__name__
+    return run
+
+
+def record_chat(root, trace_file):
+    """Record a two-turn chat; the model side is stubbed with fixed latencies and tokens"""
+    trace = ChatTrace("what does main.py do?", root)
+    trace.set_resolved_directory(root)
+    for model_ms, name, args in [(120.0, 'get_file', {'directory': '.'}),
+                                 (80.0, 'read_file', {'file_path': 'main.py'})]:
+        trace.add_model_turn(model_ms, {'prompt_tokens': 100, 'response_tokens': 10})
+        result = call_function(types.FunctionCall(name=name, args=args), root, quiet=True)
+        trace.add_tool_call(name, args, result, 1.5)
+    trace.add_model_turn(50.0, {'prompt_tokens': 150, 'response_tokens': 30})
+    trace.finish({'success': True, 'tokenCounts': {'total_tokens': 390}})
+    trace.write(trace_file)
+
+
+@with_tmp
+def test_trace_round_trip(root, trace_file):
+    record_chat(root, trace_file)
+
+    [record] = replay.load_traces(trace_file)
+    assert record['success'] is True and record['error'] is None
+    assert [len(turn['tool_calls']) for turn in record['turns']] == [1, 1, 0]
+    assert record['turns'][1]['tool_calls'][0]['result']['ok'] is True
+
+    result = replay.replay_trace(record, repo=root, model_latency_scale=0)
+    assert result['mismatches'] == 0 and result['errors'] == 0
+    assert [name for name, _, _ in result['tool_timings']] == ['get_file', 'read_file']
+
+
+@with_tmp
+def test_replay_counts_mismatches_when_tree_changed(root, trace_file):
+    record_chat(root, trace_file)
+    with open(os.path.join(root, 'main.py'), 'w') as f:
+        f.write("print('changed')\n")
+
+    [record] = replay.load_traces(trace_file)
+    result = replay.replay_trace(record, repo=root, model_latency_scale=0)
+
+    # The listing's file size and the file content both changed
+    assert result['mismatches'] == 2
+
+
+@with_tmp
+def test_main_prints_summary(root, trace_file):
+    record_chat(root, trace_file)
+    record_chat(root, trace_file)
+
+    argv = sys.argv
+    sys.argv = ['replay.py', trace_file, '--repo', root, '--model-latency-scale', '0',
+                '--concurrency', '2', '--repeat', '2']
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            replay.main()
+    finally:
+        sys.argv = argv
+
+    header, body = output.getvalue().split('\n', 1)
+    assert header == "Replaying 4 chats with concurrency 2"
+    summary = json.loads(body)
+    assert summary['chats'] == 4
+    assert summary['result_mismatches'] == 0
+    assert summary['tools']['get_file']['calls'] == 4
+    assert summary['tools']['read_file']['recorded_p50_ms'] == 1.5
+
+
+def test_percentile():
+    assert replay.percentile([], 50) is None
+    assert replay.percentile([3, 1, 2], 50) == 2
+    assert replay.percentile(list(range(1, 101)), 95) == 95
+    assert replay.percentile([5], 95) == 5
+
+
+def test_summarize_aggregates_per_tool():
+    results = [
+        {'latency_ms': 10.0, 'setup_ms': 1.0, 'mismatches': 1, 'errors': 0, 'prefetch': None,
+         'tool_timings': [('read_file', 2.0, 3.0)]},
+        {'latency_ms': 30.0, 'setup_ms': 2.0, 'mismatches': 0, 'errors': 1,
+         'prefetch': {'prefetch_hit_rate': 0.5},
+         'tool_timings': [('read_file', 4.0, 5.0), ('get_file', 1.0, 1.0)]},
+    ]
+
+    summary = replay.summarize(results, wall_seconds=2.0)
+
+    assert summary['chats'] == 2
+    assert summary['throughput_chats_per_s'] == 1.0
+    assert summary['latency_ms']['max'] == 30.0
+    assert summary['result_mismatches'] == 1 and summary['tool_errors'] == 1
+    assert summary['tools']['read_file']['calls'] == 2
+    assert summary['tools']['get_file']['replay_p50_ms'] == 1.0
+    assert summary['prefetch_hit_rate_avg'] == 0.5
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"{name}: ok")
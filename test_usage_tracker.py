@@ -0,0 +1,95 @@
+"""
+UsageTracker aggregation/compaction and /api/usage access checks.
+
+Runs under pytest or directly: python test_usage_tracker.py
+"""
+import os
+import shutil
+import tempfile
+
+import flask_api
+import usage_tracker
+from usage_tracker import UsageTracker, parse_client_keys
+
+
+def with_tracker(test):
+    def run():
+        root = tempfile.mkdtemp()
+        try:
+            test(UsageTracker(os.path.join(root, 'usage.jsonl'), client_keys={'secret-a': 'team-a'}))
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+    run.__name__ = test.__name__
+    return run
+
+
+def tokens(total):
+    return {'prompt_tokens': total - 10, 'response_tokens': 10, 'total_tokens': total}
+
+
+def test_parse_client_keys():
+    assert parse_client_keys('k1:team-a, k2:team-b,broken,') == {'k1': 'team-a', 'k2': 'team-b'}
+
+
+@with_tracker
+def test_clients_come_from_allow_list(tracker):
+    assert tracker.resolve_client('secret-a') == 'team-a'
+    assert tracker.resolve_client('made-up') == 'anonymous'
+    assert tracker.resolve_client(None) == 'anonymous'
+
+
+@with_tracker
+def test_rows_are_aggregated_on_read(tracker):
+    tracker.record('repo-1', 'team-a', tokens(100), 2)
+    tracker.record('repo-1', 'anonymous', tokens(50), 1, stop_reason='tokens')
+    tracker.record('repo-2', 'team-a', tokens(30), 1)
+
+    usage = tracker.get_usage()
+
+    assert usage['repos']['repo-1']['requests'] == 2
+    assert usage['repos']['repo-1']['total_tokens'] == 150
+    assert usage['repos']['repo-1']['terminated_early'] == 1
+    assert usage['clients']['team-a']['total_tokens'] == 130
+    assert tracker.get_usage(client='team-a')['repos'].keys() == {'repo-1', 'repo-2'}
+    assert tracker.get_usage(repo='repo-2')['clients'].keys() == {'team-a'}
+
+
+@with_tracker
+def test_compaction_keeps_totals_and_bounds_repos(tracker):
+    original = (usage_tracker.COMPACT_BYTES, usage_tracker.MAX_TRACKED_REPOS)
+    usage_tracker.COMPACT_BYTES, usage_tracker.MAX_TRACKED_REPOS = 2000, 2
+    tracker._compact_at = 2000
+    try:
+        for i in range(40):
+            tracker.record(f'repo-{i % 5}', 'team-a', tokens(100 + i % 5), 1)
+        usage = tracker.get_usage()
+    finally:
+        usage_tracker.COMPACT_BYTES, usage_tracker.MAX_TRACKED_REPOS = original
+
+    with open(tracker.usage_file, 'r') as f:
+        assert len(f.readlines()) < 40
+    assert usage['clients']['team-a']['requests'] == 40
+    assert '(other)' in usage['repos'] and len(usage['repos']) <= 3
+    assert sum(counters['requests'] for counters in usage['repos'].values()) == 40
+
+
+def test_usage_endpoint_requires_admin_token():
+    client = flask_api.app.test_client()
+    original = flask_api.USAGE_ADMIN_TOKEN
+    try:
+        flask_api.USAGE_ADMIN_TOKEN = None
+        assert client.get('/api/usage', headers={'X-Admin-Token': ''}).status_code == 403
+
+        flask_api.USAGE_ADMIN_TOKEN = 'admin'
+        assert client.get('/api/usage').status_code == 403
+        assert client.get('/api/usage', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+        assert client.get('/api/usage', headers={'X-Admin-Token': 'admin'}).status_code == 200
+    finally:
+        flask_api.USAGE_ADMIN_TOKEN = original
+
+
+if __name__ == '__main__':
+    for name, test in list(globals().items()):
+        if name.startswith('test_') and callable(test):
+            test()
+            print(f"{name}: ok")
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import os
+import time
+
+from file_lock import file_lock
+
+
+def elapsed_ms(start):
+    """Milliseconds since a time.monotonic() reading"""
+    return round((time.monotonic() - start) * 1000, 2)
+
+
+def summarize_result(content):
+    """Compact fingerprint of a call_function result (full text would bloat the trace)"""
+    try:
+        response = content.parts[0].function_response.response
+    except (AttributeError, IndexError, TypeError):
+        response = {}
+    text = str(response.get("result", response.get("error", "")))
+    return {
+        'ok': "result" in response,
+        'chars': len(text),
+        'sha1': hashlib.sha1(text.encode()).hexdigest()[:16],
+    }
+
+
+class ChatTrace:
+    """
+    One /api/chat request as a JSONL record: prompt, working directory,
+    model turns, tool calls (args, result fingerprint, timing) and outcome.
+    Consumed by replay.py.
+    """
+
+    def __init__(self, prompt, working_directory):
+        self._start = time.monotonic()
+        self.record = {
+            'version': 1,
+            'timestamp': time.time(),
+            'prompt': prompt,
+            'working_directory': working_directory,
+            'resolved_directory': None,
+            'setup_ms': None,
+            'turns': [],
+        }
+
+    def set_resolved_directory(self, local_path):
+        self.record['resolved_directory'] = local_path
+        self.record['setup_ms'] = elapsed_ms(self._start)
+
+    def add_model_turn(self, model_ms, token_info):
+        self.record['turns'].append({
+            'model_ms': model_ms,
+            'prompt_tokens': token_info.get('prompt_tokens'),
+            'response_tokens': token_info.get('response_tokens'),
+            'tool_calls': [],
+        })
+
+    def add_tool_call(self, name, args, result, tool_ms):
+        self.record['turns'][-1]['tool_calls'].append({
+            'name': name,
+            'args': args,
+            'result': summarize_result(result),
+            'tool_ms': tool_ms,
+        })
+
+    def finish(self, result):
+        self.record['total_ms'] = elapsed_ms(self._start)
+        self.record['success'] = bool(result.get('success'))
+        self.record['error'] = result.get('error')
+        self.record['stop_reason'] = result.get('stopReason')
+        self.record['token_counts'] = result.get('tokenCounts')
+
+    def write(self, trace_file):
+        """Append the trace as one line, safe across workers"""
+        os.makedirs(os.path.dirname(os.path.abspath(trace_file)), exist_ok=True)
+        line = json.dumps(self.record, separators=(',', ':'), default=str)
+        with file_lock(f"{trace_file}.lock"):
+            with open(trace_file, 'a') as f:
+                f.write(line + "\n")
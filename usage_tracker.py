@@ -0,0 +1,129 @@
+import json
+import os
+import tempfile
+import time
+
+from file_lock import file_lock
+
+# Repos beyond this many (by total tokens) are folded into OTHER_REPOS
+MAX_TRACKED_REPOS = 500
+OTHER_REPOS = '(other)'
+# Fold appended rows into per-key totals once the file grows past this
+COMPACT_BYTES = 1024 * 1024
+ANONYMOUS_CLIENT = 'anonymous'
+
+COUNTERS = ('requests', 'prompt_tokens', 'response_tokens', 'total_tokens', 'iterations', 'terminated_early')
+
+
+def parse_client_keys(value):
+    """'key1:team-a,key2:team-b' -> {'key1': 'team-a', 'key2': 'team-b'}"""
+    client_keys = {}
+    for entry in value.split(','):
+        key, _, name = entry.strip().partition(':')
+        if key and name:
+            client_keys[key] = name
+    return client_keys
+
+
+class UsageTracker:
+    """
+    Aggregated token/iteration counters per repository and per client.
+
+    Each request appends one small row to a JSONL file (USAGE_FILE, shareable
+    across workers/nodes); rows are summed when usage is read and periodically
+    compacted into one row per (repo, client). Client names come only from the
+    USAGE_CLIENT_KEYS allow-list, so callers cannot create or spoof clients.
+    """
+
+    def __init__(self, usage_file=None, client_keys=None):
+        self.usage_file = usage_file or os.environ.get('USAGE_FILE') or os.path.join(
+            tempfile.gettempdir(), 'ai_coding_buddy_usage.jsonl')
+        self.lock_path = f"{self.usage_file}.lock"
+        if client_keys is None:
+            client_keys = parse_client_keys(os.environ.get('USAGE_CLIENT_KEYS', ''))
+        self.client_keys = client_keys
+        # Raised after each compaction so a file that stays large is not rewritten on every request
+        self._compact_at = COMPACT_BYTES
+
+    def resolve_client(self, client_key):
+        """Map a caller-supplied key to its allow-listed client name"""
+        return self.client_keys.get(client_key, ANONYMOUS_CLIENT) if client_key else ANONYMOUS_CLIENT
+
+    def record(self, repo, client, token_counts, iterations, stop_reason=None):
+        """Append one request's usage"""
+        token_counts = token_counts or {}
+        row = {
+            'repo': repo,
+            'client': client,
+            'requests': 1,
+            'prompt_tokens': token_counts.get('prompt_tokens', 0),
+            'response_tokens': token_counts.get('response_tokens', 0),
+            'total_tokens': token_counts.get('total_tokens', 0),
+            'iterations': iterations or 0,
+            'terminated_early': 1 if stop_reason else 0,
+            'last_request': time.time(),
+        }
+        with file_lock(self.lock_path):
+            with open(self.usage_file, 'a') as f:
+                f.write(json.dumps(row, separators=(',', ':')) + "\n")
+            if os.path.getsize(self.usage_file) > self._compact_at:
+                self._compact()
+                self._compact_at = max(COMPACT_BYTES, 2 * os.path.getsize(self.usage_file))
+
+    def _read_rows(self):
+        try:
+            with open(self.usage_file, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+        rows = []
+        for line in lines:
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return rows
+
+    def _merge_rows(self, rows):
+        """Sum rows per (repo, client), folding the smallest repos into OTHER_REPOS"""
+        repo_tokens = {}
+        for row in rows:
+            repo_tokens[row['repo']] = repo_tokens.get(row['repo'], 0) + row['total_tokens']
+        # OTHER_REPOS (from earlier compactions) never takes one of the tracked slots
+        repo_tokens.pop(OTHER_REPOS, None)
+        tracked = set(sorted(repo_tokens, key=repo_tokens.get, reverse=True)[:MAX_TRACKED_REPOS])
+
+        merged = {}
+        for row in rows:
+            repo = row['repo'] if row['repo'] in tracked else OTHER_REPOS
+            totals = merged.setdefault((repo, row['client']), {
+                'repo': repo, 'client': row['client'], 'last_request': 0, **{name: 0 for name in COUNTERS}})
+            for name in COUNTERS:
+                totals[name] += row.get(name, 0)
+            totals['last_request'] = max(totals['last_request'], row.get('last_request', 0))
+        return list(merged.values())
+
+    def _compact(self):
+        """Rewrite the file as one row per (repo, client) (caller holds the lock)"""
+        rows = self._merge_rows(self._read_rows())
+        tmp_path = f"{self.usage_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            for row in rows:
+                f.write(json.dumps(row, separators=(',', ':')) + "\n")
+        os.replace(tmp_path, self.usage_file)
+
+    def get_usage(self, repo=None, client=None):
+        """Return counters per repo and per client, optionally filtered to one of each"""
+        with file_lock(self.lock_path):
+            rows = self._merge_rows(self._read_rows())
+
+        usage = {'repos': {}, 'clients': {}}
+        for row in rows:
+            if (repo is not None and row['repo'] != repo) or (client is not None and row['client'] != client):
+                continue
+            for group, key in (('repos', row['repo']), ('clients', row['client'])):
+                counters = usage[group].setdefault(key, {'last_request': 0, **{name: 0 for name in COUNTERS}})
+                for name in COUNTERS:
+                    counters[name] += row[name]
+                counters['last_request'] = max(counters['last_request'], row['last_request'])
+        return usage